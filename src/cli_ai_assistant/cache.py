@@ -0,0 +1,78 @@
+"""On-disk cache utilities."""
+
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+
+
+def cache_dir() -> Path:
+    """Return the cache directory, honouring XDG_CACHE_HOME."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "cli-ai-assistant"
+
+
+def read_json(path: Path, ttl_seconds: float) -> Optional[Any]:
+    """Read a JSON cache file, or return None if it is missing, invalid or expired."""
+    try:
+        if time.time() - path.stat().st_mtime > ttl_seconds:
+            return None
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: Path, data: Any) -> None:
+    """Atomically write a JSON cache file. Failures are ignored."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(orjson.dumps(data))
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def normalize_request(request: str) -> str:
+    """Normalize a request so trivially different phrasings share a cache entry."""
+    return " ".join(request.lower().split())
+
+
+class LLMCache:
+    """Disk cache of generated commands, one JSON file per request."""
+    
+    def __init__(self, directory: Optional[Path] = None, ttl_seconds: float = 86400):
+        self.directory = directory or cache_dir() / "responses"
+        self.ttl_seconds = ttl_seconds
+    
+    @staticmethod
+    def key(
+        provider: str,
+        model: str,
+        temperature: Optional[float],
+        request: str,
+        prompt_prefix: str,
+    ) -> str:
+        """
+        Build the cache key for a generation request.
+        
+        prompt_prefix is the rendered system prompt, so the key changes with
+        everything the model sees: OS, shell, directory, AWS profile and
+        Kubernetes context.
+        """
+        parts = [provider, model, str(temperature), normalize_request(request), prompt_prefix]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached command for a key, or None on a miss."""
+        entry = read_json(self.directory / f"{key}.json", self.ttl_seconds)
+        if isinstance(entry, dict) and isinstance(entry.get("command"), str):
+            return entry["command"]
+        return None
+    
+    def set(self, key: str, command: str) -> None:
+        """Store the command generated for a key."""
+        write_json(self.directory / f"{key}.json", {"command": command})
@@ -1,12 +1,26 @@
 """Environment detection utilities."""
 
+import functools
+import hashlib
 import os
+import re
 import shutil
-import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 
+from .cache import cache_dir, read_json, write_json
+from .prompts import SYSTEM_PROMPT_STATIC
 
-@dataclass
+
+# How long a detected environment stays valid on disk, in seconds
+ENV_CACHE_TTL = 60
+
+# Top-level current-context key of a kubeconfig file
+_CURRENT_CONTEXT_RE = re.compile(r"^current-context:[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+
+TOOLS_TO_CHECK = ["aws", "kubectl", "docker", "git", "terraform", "helm", "gcloud", "az"]
+
+
+@dataclass(slots=True)
 class Environment:
     """Runtime environment context."""
     os_type: str
@@ -15,10 +29,78 @@ class Environment:
     aws_profile: str | None
     k8s_context: str | None
     available_tools: list[str]
+    # System prompt rendered for this environment, so it is formatted once
+    prompt_prefix: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.prompt_prefix = SYSTEM_PROMPT_STATIC.format(
+            os_type=self.os_type,
+            shell=self.shell,
+            cwd=self.cwd,
+            aws_profile=self.aws_profile or "not set",
+            k8s_context=self.k8s_context or "not set",
+        )
+
+
+def detect_environment(refresh: bool = False) -> Environment:
+    """
+    Detect the current runtime environment.
+    
+    The result is cached in memory and on disk for ENV_CACHE_TTL seconds, keyed
+    on the environment variables, directory and kubeconfig files it depends on.
+    Pass refresh=True to bypass the cache and probe again.
+    """
+    key = _environment_key()
+    if refresh:
+        _cached_environment.cache_clear()
+        env = _probe_environment()
+        _store_environment(key, env)
+        return env
+    return _cached_environment(key)
+
+
+def _environment_key() -> str:
+    """Hash the inputs that detection depends on."""
+    parts = [
+        os.environ.get("PATH", ""),
+        os.environ.get("SHELL", ""),
+        os.environ.get("AWS_PROFILE", ""),
+        os.environ.get("AWS_DEFAULT_PROFILE", ""),
+        os.environ.get("KUBECONFIG", ""),
+        os.getcwd(),
+    ]
+    # Switching kubectl context rewrites the kubeconfig, so its mtime is part of the key
+    for path in _kubeconfig_paths():
+        try:
+            parts.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            parts.append("")
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
 
 
-def detect_environment() -> Environment:
-    """Detect the current runtime environment."""
+@functools.lru_cache(maxsize=1)
+def _cached_environment(key: str) -> Environment:
+    """Load the environment from the disk cache, probing on a miss."""
+    cached = read_json(cache_dir() / "env.json", ENV_CACHE_TTL)
+    if isinstance(cached, dict) and cached.get("key") == key:
+        try:
+            return Environment(**cached["environment"])
+        except (KeyError, TypeError):
+            pass
+    
+    env = _probe_environment()
+    _store_environment(key, env)
+    return env
+
+
+def _store_environment(key: str, env: Environment) -> None:
+    """Write the environment to the disk cache."""
+    data = {f.name: getattr(env, f.name) for f in fields(env) if f.init}
+    write_json(cache_dir() / "env.json", {"key": key, "environment": data})
+
+
+def _probe_environment() -> Environment:
+    """Probe the runtime environment without caching."""
     import platform
     
     # OS detection
@@ -36,24 +118,11 @@ def detect_environment() -> Environment:
     # AWS profile
     aws_profile = os.environ.get("AWS_PROFILE") or os.environ.get("AWS_DEFAULT_PROFILE")
     
-    # Kubernetes context
-    k8s_context = None
-    if shutil.which("kubectl"):
-        try:
-            result = subprocess.run(
-                ["kubectl", "config", "current-context"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            if result.returncode == 0:
-                k8s_context = result.stdout.strip()
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-    
     # Available tools
-    tools_to_check = ["aws", "kubectl", "docker", "git", "terraform", "helm", "gcloud", "az"]
-    available_tools = [tool for tool in tools_to_check if shutil.which(tool)]
+    available_tools = [tool for tool in TOOLS_TO_CHECK if shutil.which(tool)]
+    
+    # Kubernetes context
+    k8s_context = _kubectl_context() if "kubectl" in available_tools else None
     
     return Environment(
         os_type=os_type,
@@ -63,3 +132,32 @@ def detect_environment() -> Environment:
         k8s_context=k8s_context,
         available_tools=available_tools,
     )
+
+
+def _kubectl_context() -> str | None:
+    """
+    Return the current kubectl context.
+    
+    Reads current-context straight from the kubeconfig files instead of
+    spawning kubectl. As with kubectl, the first file in KUBECONFIG that
+    sets it wins.
+    """
+    for path in _kubeconfig_paths():
+        try:
+            with open(path, encoding="utf-8") as f:
+                match = _CURRENT_CONTEXT_RE.search(f.read())
+        except (OSError, UnicodeDecodeError):
+            continue
+        if match:
+            context = match.group(1).strip().strip("'\"")
+            if context:
+                return context
+    return None
+
+
+def _kubeconfig_paths() -> list[str]:
+    """Return the kubeconfig files kubectl would read, in priority order."""
+    kubeconfig = os.environ.get("KUBECONFIG")
+    if kubeconfig:
+        return [path for path in kubeconfig.split(os.pathsep) if path]
+    return [os.path.join(os.path.expanduser("~"), ".kube", "config")]
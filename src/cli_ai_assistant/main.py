@@ -1,19 +1,30 @@
 """Main CLI entry point."""
 
+import asyncio
+import base64
+import os
+import re
 import sys
 import click
 from rich.console import Console
-from rich.panel import Panel
-from rich.syntax import Syntax
 
-from .environment import detect_environment
+from .cache import LLMCache
+from .environment import Environment, detect_environment
 from .executor import stream_command
 from .prompts import is_dangerous_command
-from .providers import get_provider
+from .providers import AIProvider, get_available_providers, get_provider
 
 
 console = Console()
 
+# TERM_PROGRAM values of terminals that support setting the clipboard via OSC 52.
+# Apple_Terminal ignores the escape, and tmux drops it from applications under its
+# default set-clipboard=external, so both are deliberately absent.
+OSC52_TERMINALS = frozenset({"iTerm.app", "WezTerm", "vscode", "ghostty"})
+
+# A fenced markdown code block with an optional language line
+_CODE_BLOCK_RE = re.compile(r"^```(?:[^\n`]*\n)?(.*?)\n?\s*```$", re.DOTALL)
+
 
 @click.command()
 @click.argument("request", nargs=-1, required=True)
@@ -21,8 +32,39 @@ console = Console()
 @click.option("--dry", is_flag=True, help="Show command only, don't execute")
 @click.option("--provider", "-p", type=str, help="AI provider (openai, anthropic)")
 @click.option("--copy", "-c", is_flag=True, help="Copy command to clipboard")
+@click.option(
+    "--clipboard",
+    type=click.Choice(["auto", "osc52", "subprocess"]),
+    default="auto",
+    help="How --copy writes the clipboard: terminal escape (osc52) or pbcopy/xclip",
+)
+@click.option(
+    "--refresh-env",
+    is_flag=True,
+    help="Re-detect the environment instead of using the cache",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Ask the AI provider again instead of reusing a cached command",
+)
+@click.option(
+    "--race",
+    is_flag=True,
+    help="Ask every configured provider and use the first answer (never uses the cache)",
+)
 @click.version_option(package_name="cli-ai-assistant")
-def cli(request: tuple[str, ...], yes: bool, dry: bool, provider: str, copy: bool):
+def cli(
+    request: tuple[str, ...],
+    yes: bool,
+    dry: bool,
+    provider: str,
+    copy: bool,
+    clipboard: str,
+    refresh_env: bool,
+    no_cache: bool,
+    race: bool,
+):
     """
     Translate natural language into shell commands.
     
@@ -42,24 +84,45 @@ def cli(request: tuple[str, ...], yes: bool, dry: bool, provider: str, copy: boo
         console.print("[red]Error:[/red] Please provide a request")
         sys.exit(1)
     
+    if race and provider:
+        raise click.UsageError("--race asks every configured provider; drop --provider")
+    
     try:
         # Detect environment
-        env = detect_environment()
+        env = detect_environment(refresh=refresh_env)
         
-        # Get AI provider
-        ai_provider = get_provider(provider)
-        
-        # Generate command
-        with console.status("[bold blue]Thinking..."):
-            command = ai_provider.generate_command(request_str, env)
-        
-        # Clean up command (remove markdown code blocks if present)
-        command = clean_command(command)
-        
-        # Display the command
-        console.print()
-        syntax = Syntax(command, "bash", theme="monokai", word_wrap=True)
-        console.print(Panel(syntax, title="[bold green]Command", border_style="green"))
+        if race:
+            # Ask every configured provider at once and keep the fastest answer
+            ai_providers = get_available_providers()
+            with console.status(f"[bold blue]Racing {len(ai_providers)} providers..."):
+                winner, command = asyncio.run(race_providers(ai_providers, request_str, env))
+            console.print()
+            console.print(command_panel(command))
+            console.print(f"[dim]✓ Answered by {winner.name}[/dim]")
+        else:
+            # Get AI provider
+            ai_provider = get_provider(provider)
+            
+            # Reuse a previously generated command for the same request if we have one.
+            # --no-cache only skips the lookup; the fresh command still replaces the entry.
+            response_cache = LLMCache()
+            cache_key = LLMCache.key(
+                ai_provider.name,
+                ai_provider.model,
+                ai_provider.temperature,
+                request_str,
+                env.prompt_prefix,
+            )
+            command = None if no_cache else response_cache.get(cache_key)
+            
+            if command is not None:
+                console.print()
+                console.print(command_panel(command))
+                console.print("[dim]✓ From cache (use --no-cache to regenerate)[/dim]")
+            else:
+                command = asyncio.run(generate_command(ai_provider, request_str, env))
+                if command:
+                    response_cache.set(cache_key, command)
         
         # Check for dangerous commands
         is_dangerous = is_dangerous_command(command)
@@ -68,17 +131,10 @@ def cli(request: tuple[str, ...], yes: bool, dry: bool, provider: str, copy: boo
         
         # Copy to clipboard if requested
         if copy:
-            try:
-                import subprocess
-                subprocess.run(["pbcopy"], input=command.encode(), check=True)
+            if copy_to_clipboard(command, clipboard):
                 console.print("[dim]✓ Copied to clipboard[/dim]")
-            except Exception:
-                # Try xclip for Linux
-                try:
-                    subprocess.run(["xclip", "-selection", "clipboard"], input=command.encode(), check=True)
-                    console.print("[dim]✓ Copied to clipboard[/dim]")
-                except Exception:
-                    console.print("[dim]Could not copy to clipboard[/dim]")
+            else:
+                console.print("[dim]Could not copy to clipboard[/dim]")
         
         # Dry run - just show the command
         if dry:
@@ -108,19 +164,122 @@ def cli(request: tuple[str, ...], yes: bool, dry: bool, provider: str, copy: boo
         sys.exit(1)
 
 
+async def generate_command(ai_provider: AIProvider, request: str, env: Environment) -> str:
+    """Generate a command, showing it as it streams in."""
+    from rich.live import Live
+    from rich.spinner import Spinner
+    
+    console.print()
+    response = ""
+    thinking = Spinner("dots", text="[bold blue]Thinking...")
+    with Live(thinking, console=console, refresh_per_second=12) as live:
+        async for chunk in ai_provider.generate_command(request, env):
+            response += chunk
+            live.update(command_panel(clean_command(response)))
+        
+        # Clean up command (remove markdown code blocks if present)
+        command = clean_command(response)
+        live.update(command_panel(command))
+    
+    return command
+
+
+async def race_providers(
+    ai_providers: list[AIProvider], request: str, env: Environment
+) -> tuple[AIProvider, str]:
+    """
+    Ask several providers concurrently and return the first successful answer.
+    
+    Providers that fail or return an empty command are skipped; the rest are
+    cancelled once one succeeds.
+    """
+    async def collect(ai_provider: AIProvider) -> tuple[AIProvider, str]:
+        chunks = [chunk async for chunk in ai_provider.generate_command(request, env)]
+        command = clean_command("".join(chunks))
+        if not command:
+            raise ValueError(f"{ai_provider.name} returned an empty command")
+        return ai_provider, command
+    
+    tasks = [asyncio.create_task(collect(ai_provider)) for ai_provider in ai_providers]
+    error: Exception | None = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except Exception as e:
+                error = e
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def copy_to_clipboard(command: str, method: str = "auto") -> bool:
+    """
+    Copy a command to the clipboard.
+    
+    OSC 52 asks the terminal itself to set the clipboard, which needs no
+    external process. In auto mode it is used in terminals known to support
+    it and over SSH, where a remote host has no clipboard tool to fall back
+    to; otherwise pbcopy or xclip is tried.
+    
+    The escape cannot be acknowledged, so over SSH the copy silently does
+    nothing if the local terminal ignores OSC 52.
+    
+    Returns:
+        True if the command was copied or the escape was sent to the terminal
+    """
+    if method == "auto":
+        method = "osc52" if supports_osc52() else "subprocess"
+    
+    if method == "osc52":
+        encoded = base64.b64encode(command.encode()).decode()
+        sys.stdout.write(f"\x1b]52;c;{encoded}\x07")
+        sys.stdout.flush()
+        return True
+    
+    import subprocess
+    
+    for clipboard_command in (["pbcopy"], ["xclip", "-selection", "clipboard"]):
+        try:
+            subprocess.run(clipboard_command, input=command.encode(), check=True)
+            return True
+        except Exception:
+            pass
+    return False
+
+
+def supports_osc52() -> bool:
+    """Check whether stdout is a terminal that should honour OSC 52."""
+    if not sys.stdout.isatty():
+        return False
+    # A remote host has no local clipboard tool; the escape reaches the user's terminal
+    if os.environ.get("SSH_TTY") or os.environ.get("SSH_CONNECTION"):
+        return True
+    return os.environ.get("TERM_PROGRAM") in OSC52_TERMINALS
+
+
+def command_panel(command: str):
+    """Render a command as a syntax-highlighted panel."""
+    # rich renderables are imported lazily to keep startup fast
+    from rich.panel import Panel
+    from rich.syntax import Syntax
+    
+    syntax = Syntax(command, "bash", theme="monokai", word_wrap=True)
+    return Panel(syntax, title="[bold green]Command", border_style="green")
+
+
 def clean_command(command: str) -> str:
     """Remove markdown formatting from command."""
     command = command.strip()
     
     # Remove markdown code blocks
-    if command.startswith("```"):
-        lines = command.split("\n")
-        # Remove first line (```bash or ```)
-        lines = lines[1:]
-        # Remove last line if it's just ```
-        if lines and lines[-1].strip() == "```":
-            lines = lines[:-1]
-        command = "\n".join(lines)
+    match = _CODE_BLOCK_RE.match(command)
+    if match:
+        command = match.group(1)
+    elif command.startswith("```"):
+        # Unterminated block (e.g. mid-stream): drop the opening fence line
+        command = command.partition("\n")[2]
     
     # Remove inline code backticks
     if command.startswith("`") and command.endswith("`"):
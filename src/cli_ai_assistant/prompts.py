@@ -1,6 +1,11 @@
 """Command generation prompts and templates."""
 
-SYSTEM_PROMPT = """You are a CLI command generator. Your job is to translate natural language requests into shell commands.
+import re
+
+# The system prompt is ordered static-first: the rules never change and the
+# context only changes when the environment does. Providers cache repeated
+# prompt prefixes, so this keeps the cacheable prefix as long as possible.
+RULES_PROMPT = """You are a CLI command generator. Your job is to translate natural language requests into shell commands.
 
 RULES:
 1. Output ONLY the command - no explanations, no markdown, no code blocks
@@ -12,16 +17,20 @@ RULES:
 7. For Git, use standard git commands
 8. Include helpful flags like --output table, -o wide, --format when they improve readability
 
-CONTEXT:
+OUTPUT: Just the command, nothing else."""
+
+CONTEXT_PROMPT = """CONTEXT:
 - Operating System: {os_type}
 - Shell: {shell}
 - Current Directory: {cwd}
 - AWS Profile (if set): {aws_profile}
-- Kubernetes Context (if set): {k8s_context}
+- Kubernetes Context (if set): {k8s_context}"""
 
-USER REQUEST: {request}
+# Rendered once per Environment and sent as the system message; the user
+# turn carries only the request.
+SYSTEM_PROMPT_STATIC = f"""{RULES_PROMPT}
 
-OUTPUT: Just the command, nothing else."""
+{CONTEXT_PROMPT}"""
 
 
 DANGEROUS_PATTERNS = [
@@ -59,19 +68,47 @@ DANGEROUS_PATTERNS = [
 ]
 
 
+# Common read-only commands that skip the dangerous pattern scan
+SAFE_PREFIXES = (
+    "ls ",
+    "kubectl get",
+    "kubectl describe",
+    "kubectl logs",
+    "docker ps",
+    "docker logs",
+    "aws s3 ls",
+    "aws ec2 describe",
+    "git status",
+    "git log",
+    "git diff",
+)
+
+
+# Patterns containing regex metacharacters are matched as regexes, the rest as
+# plain substrings. Both are lowercased and folded into one alternation compiled
+# at import time; commands are lowercased once before matching, which is faster
+# than re.IGNORECASE.
+_REGEX_METACHARACTERS = set(".^$*+?{}[]\\|()")
+_DANGEROUS_REGEXES = [p.lower() for p in DANGEROUS_PATTERNS if _REGEX_METACHARACTERS & set(p)]
+_DANGEROUS_LITERALS = [p.lower() for p in DANGEROUS_PATTERNS if not _REGEX_METACHARACTERS & set(p)]
+_DANGEROUS_EXPRESSIONS = _DANGEROUS_REGEXES + [re.escape(p) for p in _DANGEROUS_LITERALS]
+_DANGEROUS_RE = re.compile("|".join(_DANGEROUS_EXPRESSIONS))
+
+
+# Chaining, pipes, redirection and substitution can hide anything after a safe prefix
+_SHELL_OPERATOR_RE = re.compile(r"[;&|<>`\n]|\$\(")
+
+
 def is_dangerous_command(command: str) -> bool:
     """Check if a command matches known dangerous patterns."""
-    import re
-    command_lower = command.lower()
+    command_lower = command.strip().lower()
     
-    for pattern in DANGEROUS_PATTERNS:
-        if pattern.lower() in command_lower:
-            return True
-        # Check regex patterns
-        try:
-            if re.search(pattern, command, re.IGNORECASE):
-                return True
-        except re.error:
-            pass
+    # Fast path for a single well-known read-only command
+    if (
+        (command_lower == "ls" or command_lower.startswith(SAFE_PREFIXES))
+        and "--force" not in command_lower
+        and not _SHELL_OPERATOR_RE.search(command_lower)
+    ):
+        return False
     
-    return False
+    return _DANGEROUS_RE.search(command_lower) is not None
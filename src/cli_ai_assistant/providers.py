@@ -1,92 +1,152 @@
 """AI providers for command generation."""
 
+import functools
+import logging
 import os
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import AsyncIterator, Optional
 
+from .cache import cache_dir, read_json, write_json
 from .environment import Environment
-from .prompts import SYSTEM_PROMPT
+
+
+logger = logging.getLogger(__name__)
+
+# How long the AmpCode availability probe result is cached, in seconds
+AMPCODE_PROBE_TTL = 10
+
+NO_PROVIDER_ERROR = (
+    "No API key found. "
+    "Set ANTHROPIC_API_KEY, OPENAI_API_KEY, MINIMAX_API_KEY, or QWEN_API_KEY."
+)
 
 
 class AIProvider(ABC):
     """Base class for AI providers."""
     
+    name: str
+    model: str
+    temperature: Optional[float] = None
+    
     @abstractmethod
-    def generate_command(self, request: str, env: Environment) -> str:
-        """Generate a shell command from natural language."""
+    def generate_command(self, request: str, env: Environment) -> AsyncIterator[str]:
+        """Generate a shell command from natural language, yielding text as it streams in."""
         pass
 
 
+def chat_messages(request: str, env: Environment) -> list[dict[str, str]]:
+    """
+    Build chat messages for OpenAI-compatible APIs.
+    
+    The rules and context go in the system message, which is identical across
+    calls in a session and so benefits from automatic prompt caching; only the
+    request changes in the user turn.
+    """
+    return [
+        {"role": "system", "content": env.prompt_prefix},
+        {"role": "user", "content": request},
+    ]
+
+
+async def stream_chat_content(stream) -> AsyncIterator[str]:
+    """Yield the text deltas from a streaming chat completion."""
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
 class OpenAIProvider(AIProvider):
     """OpenAI provider using GPT models."""
     
+    name = "openai"
+    temperature = 0.1
+    
     def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o-mini"):
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
         self.model = model
     
-    def generate_command(self, request: str, env: Environment) -> str:
-        """Generate command using OpenAI."""
-        from openai import OpenAI
+    @functools.cached_property
+    def _client(self):
+        """SDK client, created on first use so the SDK is only imported when needed."""
+        from openai import AsyncOpenAI
         
-        client = OpenAI(api_key=self.api_key)
-        
-        prompt = SYSTEM_PROMPT.format(
-            os_type=env.os_type,
-            shell=env.shell,
-            cwd=env.cwd,
-            aws_profile=env.aws_profile or "not set",
-            k8s_context=env.k8s_context or "not set",
-            request=request,
-        )
-        
-        response = client.chat.completions.create(
+        return AsyncOpenAI(api_key=self.api_key)
+    
+    async def generate_command(self, request: str, env: Environment) -> AsyncIterator[str]:
+        """Generate command using OpenAI."""
+        response = await self._client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(request, env),
             max_tokens=500,
-            temperature=0.1,
+            temperature=self.temperature,
+            stream=True,
         )
         
-        return response.choices[0].message.content.strip()
+        async for text in stream_chat_content(response):
+            yield text
 
 
 class AnthropicProvider(AIProvider):
     """Anthropic provider using Claude models."""
     
+    name = "anthropic"
+    
     def __init__(self, api_key: Optional[str] = None, model: str = "claude-3-5-sonnet-20241022"):
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("Anthropic API key not found. Set ANTHROPIC_API_KEY environment variable.")
         self.model = model
+        
+        # Prompt cache usage reported by the last response
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
     
-    def generate_command(self, request: str, env: Environment) -> str:
-        """Generate command using Anthropic."""
+    @functools.cached_property
+    def _client(self):
+        """SDK client, created on first use so the SDK is only imported when needed."""
         import anthropic
         
-        client = anthropic.Anthropic(api_key=self.api_key)
-        
-        prompt = SYSTEM_PROMPT.format(
-            os_type=env.os_type,
-            shell=env.shell,
-            cwd=env.cwd,
-            aws_profile=env.aws_profile or "not set",
-            k8s_context=env.k8s_context or "not set",
-            request=request,
-        )
-        
-        response = client.messages.create(
+        return anthropic.AsyncAnthropic(api_key=self.api_key)
+    
+    async def generate_command(self, request: str, env: Environment) -> AsyncIterator[str]:
+        """Generate command using Anthropic."""
+        # Mark the static system prompt as cacheable so repeated calls only pay
+        # for the user request. Anthropic only caches prefixes of at least 1024
+        # tokens (2048 for Haiku); the current rules + context are well below
+        # that, so the marker is a no-op until the prompt grows.
+        async with self._client.messages.stream(
             model=self.model,
             max_tokens=500,
-            messages=[{"role": "user", "content": prompt}],
-        )
+            system=[
+                {
+                    "type": "text",
+                    "text": env.prompt_prefix,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+            messages=[{"role": "user", "content": request}],
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            usage = (await stream.get_final_message()).usage
         
-        return response.content[0].text.strip()
+        self.cache_creation_input_tokens = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        self.cache_read_input_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+        logger.debug(
+            "Anthropic prompt cache: %d tokens written, %d tokens read",
+            self.cache_creation_input_tokens,
+            self.cache_read_input_tokens,
+        )
 
 
 class MinimaxProvider(AIProvider):
     """Minimax provider using OpenAI-compatible API."""
     
+    name = "minimax"
+    temperature = 0.1
+    
     def __init__(self, api_key: Optional[str] = None, model: str = "MiniMax-M2.1"):
         self.api_key = api_key or os.environ.get("MINIMAX_API_KEY")
         if not self.api_key:
@@ -94,34 +154,33 @@ class MinimaxProvider(AIProvider):
         self.model = model
         self.base_url = "https://api.minimax.io/v1"
     
-    def generate_command(self, request: str, env: Environment) -> str:
-        """Generate command using Minimax."""
-        from openai import OpenAI
-        
-        client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-        
-        prompt = SYSTEM_PROMPT.format(
-            os_type=env.os_type,
-            shell=env.shell,
-            cwd=env.cwd,
-            aws_profile=env.aws_profile or "not set",
-            k8s_context=env.k8s_context or "not set",
-            request=request,
-        )
+    @functools.cached_property
+    def _client(self):
+        """SDK client, created on first use so the SDK is only imported when needed."""
+        from openai import AsyncOpenAI
         
-        response = client.chat.completions.create(
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+    
+    async def generate_command(self, request: str, env: Environment) -> AsyncIterator[str]:
+        """Generate command using Minimax."""
+        response = await self._client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(request, env),
             max_tokens=500,
-            temperature=0.1,
+            temperature=self.temperature,
+            stream=True,
         )
         
-        return response.choices[0].message.content.strip()
+        async for text in stream_chat_content(response):
+            yield text
 
 
 class QwenProvider(AIProvider):
     """Qwen provider using OpenAI-compatible API."""
     
+    name = "qwen"
+    temperature = 0.1
+    
     def __init__(self, api_key: Optional[str] = None, model: str = "qwen-coder-plus"):
         self.api_key = api_key or os.environ.get("QWEN_API_KEY")
         if not self.api_key:
@@ -129,62 +188,57 @@ class QwenProvider(AIProvider):
         self.model = model
         self.base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     
-    def generate_command(self, request: str, env: Environment) -> str:
-        """Generate command using Qwen."""
-        from openai import OpenAI
-        
-        client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-        
-        prompt = SYSTEM_PROMPT.format(
-            os_type=env.os_type,
-            shell=env.shell,
-            cwd=env.cwd,
-            aws_profile=env.aws_profile or "not set",
-            k8s_context=env.k8s_context or "not set",
-            request=request,
-        )
+    @functools.cached_property
+    def _client(self):
+        """SDK client, created on first use so the SDK is only imported when needed."""
+        from openai import AsyncOpenAI
         
-        response = client.chat.completions.create(
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+    
+    async def generate_command(self, request: str, env: Environment) -> AsyncIterator[str]:
+        """Generate command using Qwen."""
+        response = await self._client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(request, env),
             max_tokens=500,
-            temperature=0.1,
+            temperature=self.temperature,
+            stream=True,
         )
         
-        return response.choices[0].message.content.strip()
+        async for text in stream_chat_content(response):
+            yield text
 
 
 class AmpCodeProvider(AIProvider):
     """AmpCode local provider using OpenAI-compatible API."""
     
+    name = "ampcode"
+    temperature = 0.1
+    
     def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash"):
         self.api_key = api_key or os.environ.get("AMPCODE_API_KEY", "your-api-key-1")
         self.model = model
         self.base_url = os.environ.get("AMPCODE_BASE_URL", "http://127.0.0.1:8317/v1")
     
-    def generate_command(self, request: str, env: Environment) -> str:
-        """Generate command using AmpCode."""
-        from openai import OpenAI
+    @functools.cached_property
+    def _client(self):
+        """SDK client, created on first use so the SDK is only imported when needed."""
+        from openai import AsyncOpenAI
         
-        client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-        
-        prompt = SYSTEM_PROMPT.format(
-            os_type=env.os_type,
-            shell=env.shell,
-            cwd=env.cwd,
-            aws_profile=env.aws_profile or "not set",
-            k8s_context=env.k8s_context or "not set",
-            request=request,
-        )
-        
-        response = client.chat.completions.create(
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+    
+    async def generate_command(self, request: str, env: Environment) -> AsyncIterator[str]:
+        """Generate command using AmpCode."""
+        response = await self._client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(request, env),
             max_tokens=500,
-            temperature=0.1,
+            temperature=self.temperature,
+            stream=True,
         )
         
-        return response.choices[0].message.content.strip()
+        async for text in stream_chat_content(response):
+            yield text
 
 
 def get_provider(provider_name: Optional[str] = None) -> AIProvider:
@@ -204,19 +258,8 @@ def get_provider(provider_name: Optional[str] = None) -> AIProvider:
         else:
             raise ValueError(f"Unknown provider: {provider_name}")
     
-    # Auto-detect based on available API keys or local services
-    # Try AmpCode first (local, fast, free)
-    try:
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(0.5)
-        result = sock.connect_ex(('127.0.0.1', 8317))
-        sock.close()
-        if result == 0:
-            return AmpCodeProvider()
-    except Exception:
-        pass
-    
+    # Auto-detect based on available API keys, then local services.
+    # Checking keys first means configured users never pay for the probe.
     if os.environ.get("ANTHROPIC_API_KEY"):
         return AnthropicProvider()
     elif os.environ.get("OPENAI_API_KEY"):
@@ -225,7 +268,48 @@ def get_provider(provider_name: Optional[str] = None) -> AIProvider:
         return MinimaxProvider()
     elif os.environ.get("QWEN_API_KEY"):
         return QwenProvider()
+    elif ampcode_available():
+        return AmpCodeProvider()
     else:
-        raise ValueError(
-            "No API key found. Set ANTHROPIC_API_KEY, OPENAI_API_KEY, MINIMAX_API_KEY, or QWEN_API_KEY."
-        )
+        raise ValueError(NO_PROVIDER_ERROR)
+
+
+def get_available_providers() -> list[AIProvider]:
+    """Get every provider that has credentials configured or a local service running."""
+    provider_classes = [
+        (AnthropicProvider, "ANTHROPIC_API_KEY"),
+        (OpenAIProvider, "OPENAI_API_KEY"),
+        (MinimaxProvider, "MINIMAX_API_KEY"),
+        (QwenProvider, "QWEN_API_KEY"),
+    ]
+    available = [cls() for cls, env_var in provider_classes if os.environ.get(env_var)]
+    if ampcode_available():
+        available.append(AmpCodeProvider())
+    if not available:
+        raise ValueError(NO_PROVIDER_ERROR)
+    return available
+
+
+def ampcode_available() -> bool:
+    """
+    Check whether a local AmpCode server is listening.
+    
+    The result is cached on disk for AMPCODE_PROBE_TTL seconds so back-to-back
+    invocations skip the socket probe.
+    """
+    cache_path = cache_dir() / "ampcode.json"
+    cached = read_json(cache_path, AMPCODE_PROBE_TTL)
+    if isinstance(cached, dict) and isinstance(cached.get("available"), bool):
+        return cached["available"]
+    
+    import socket
+    
+    try:
+        # Loopback connects or refuses almost instantly
+        with socket.create_connection(("127.0.0.1", 8317), timeout=0.05):
+            available = True
+    except OSError:
+        available = False
+    
+    write_json(cache_path, {"available": available})
+    return available
@@ -1,9 +1,18 @@
 """Tests for CLI AI Assistant."""
 
+import asyncio
+import os
+import sys
+
 import pytest
-from cli_ai_assistant.prompts import is_dangerous_command
-from cli_ai_assistant.environment import detect_environment
+from click.testing import CliRunner
+from cli_ai_assistant import environment
+from cli_ai_assistant.prompts import RULES_PROMPT, SYSTEM_PROMPT_STATIC, is_dangerous_command
+from cli_ai_assistant.environment import Environment, detect_environment
+from cli_ai_assistant import main
 from cli_ai_assistant.main import clean_command
+from cli_ai_assistant import providers
+from cli_ai_assistant.providers import chat_messages
 
 
 class TestDangerousCommands:
@@ -24,6 +33,12 @@ class TestDangerousCommands:
     def test_drop_table_is_dangerous(self):
         assert is_dangerous_command("psql -c 'DROP TABLE users'")
     
+    def test_lowercase_drop_table_is_dangerous(self):
+        assert is_dangerous_command("psql -c 'drop table users'")
+    
+    def test_aws_terminate_is_dangerous(self):
+        assert is_dangerous_command("aws ec2 terminate-instances --instance-ids i-123")
+    
     def test_ls_is_not_dangerous(self):
         assert not is_dangerous_command("ls -la")
     
@@ -35,6 +50,86 @@ class TestDangerousCommands:
     
     def test_aws_list_is_not_dangerous(self):
         assert not is_dangerous_command("aws s3 ls")
+    
+    def test_safe_prefix_with_follow_flag_is_not_dangerous(self):
+        assert not is_dangerous_command("kubectl logs -f nginx")
+    
+    def test_git_branch_force_is_dangerous(self):
+        assert is_dangerous_command("git branch --force x")
+        assert is_dangerous_command("git branch -f main HEAD~3")
+    
+    def test_ls_prefix_needs_word_boundary(self):
+        assert not is_dangerous_command("ls")
+        assert is_dangerous_command("lsx -f /tmp/test")
+    
+    def test_safe_prefix_does_not_hide_chained_commands(self):
+        assert is_dangerous_command("ls; rm -rf /")
+        assert is_dangerous_command("git log && git push --force origin main")
+        assert is_dangerous_command("ls $(rm -rf /tmp/test)")
+    
+    def test_uppercase_command_is_dangerous(self):
+        assert is_dangerous_command("aws ec2 terminate-instances --instance-ids i-123")
+        assert is_dangerous_command("RM -RF /tmp/test")
+        assert not is_dangerous_command("kubectl get pods")
+
+
+class TestPrompts:
+    """Tests for prompt templates."""
+    
+    def test_static_prompt_excludes_request(self):
+        prompt = SYSTEM_PROMPT_STATIC.format(
+            os_type="linux",
+            shell="bash",
+            cwd="/tmp",
+            aws_profile="not set",
+            k8s_context="not set",
+        )
+        assert "USER REQUEST" not in prompt
+        assert "Operating System: linux" in prompt
+    
+    def test_chat_messages_put_static_prompt_first(self):
+        env = Environment(
+            os_type="linux",
+            shell="bash",
+            cwd="/tmp",
+            aws_profile=None,
+            k8s_context=None,
+            available_tools=[],
+        )
+        messages = chat_messages("list files", env)
+        assert messages[0]["role"] == "system"
+        assert messages[0]["content"].startswith(RULES_PROMPT)
+        assert "Operating System: linux" in messages[0]["content"]
+        assert messages[1] == {"role": "user", "content": "list files"}
+
+
+class TestProviders:
+    """Tests for provider selection."""
+    
+    def test_api_key_skips_ampcode_probe(self, monkeypatch):
+        def fail_probe():
+            raise AssertionError("AmpCode should not be probed")
+        
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+        monkeypatch.setattr(providers, "ampcode_available", fail_probe)
+        assert isinstance(providers.get_provider(), providers.AnthropicProvider)
+    
+    def test_client_is_created_lazily_and_reused(self):
+        provider = providers.OpenAIProvider(api_key="test-key")
+        assert "_client" not in vars(provider)
+        assert provider._client is provider._client
+    
+    def test_ampcode_probe_is_cached(self, monkeypatch):
+        calls = []
+        
+        def refuse(address, timeout):
+            calls.append(address)
+            raise ConnectionRefusedError
+        
+        monkeypatch.setattr("socket.create_connection", refuse)
+        assert not providers.ampcode_available()
+        assert not providers.ampcode_available()
+        assert len(calls) == 1
 
 
 class TestEnvironment:
@@ -45,6 +140,32 @@ class TestEnvironment:
         assert env.os_type in ("linux", "macos", "windows")
         assert env.shell is not None
         assert env.cwd is not None
+    
+    def test_environment_is_cached_on_disk(self, isolated_cache, monkeypatch):
+        env = detect_environment(refresh=True)
+        assert (isolated_cache / "cli-ai-assistant" / "env.json").exists()
+        
+        environment._cached_environment.cache_clear()
+        monkeypatch.setattr(environment, "_probe_environment", lambda: pytest.fail("re-probed"))
+        cached = detect_environment()
+        assert cached == env
+        assert cached.prompt_prefix == env.prompt_prefix
+    
+    def test_kubectl_context_read_from_kubeconfig(self, tmp_path, monkeypatch):
+        kubeconfig = tmp_path / "config"
+        kubeconfig.write_text("apiVersion: v1\ncurrent-context: \"prod-cluster\"\nkind: Config\n")
+        monkeypatch.setenv("KUBECONFIG", f"{tmp_path / 'missing'}{os.pathsep}{kubeconfig}")
+        assert environment._kubectl_context() == "prod-cluster"
+    
+    def test_kubeconfig_change_invalidates_cache(self, tmp_path, monkeypatch):
+        kubeconfig = tmp_path / "config"
+        kubeconfig.write_text("current-context: dev\n")
+        monkeypatch.setenv("KUBECONFIG", str(kubeconfig))
+        key = environment._environment_key()
+        
+        kubeconfig.write_text("current-context: prod\n")
+        os.utime(kubeconfig, ns=(0, 1_000_000_000))
+        assert environment._environment_key() != key
 
 
 class TestCleanCommand:
@@ -66,3 +187,128 @@ class TestCleanCommand:
         command = "```bash\naws s3 ls\naws s3 cp file.txt s3://bucket/\n```"
         expected = "aws s3 ls\naws s3 cp file.txt s3://bucket/"
         assert clean_command(command) == expected
+    
+    def test_clean_single_line_code_block(self):
+        assert clean_command("```ls -la```") == "ls -la"
+    
+    def test_clean_unterminated_code_block(self):
+        assert clean_command("```bash\nls -la") == "ls -la"
+
+
+
+class FakeProvider(providers.AIProvider):
+    """Provider that streams a canned response."""
+    
+    name = "fake"
+    model = "fake-model"
+    
+    def __init__(self, chunks, delay=0, error=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+    
+    async def generate_command(self, request, env):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        for chunk in self.chunks:
+            yield chunk
+
+
+class TestCli:
+    """Tests for the CLI entry point."""
+    
+    def test_streamed_command_is_shown(self, monkeypatch):
+        provider = FakeProvider(["```bash\n", "docker ", "ps", "\n```"])
+        monkeypatch.setattr(main, "get_provider", lambda name: provider)
+        
+        result = CliRunner().invoke(main.cli, ["--dry", "show", "containers"])
+        assert result.exit_code == 0
+        assert "docker ps" in result.output
+    
+    def test_repeated_request_uses_cache(self, monkeypatch):
+        provider = FakeProvider(["git status"])
+        monkeypatch.setattr(main, "get_provider", lambda name: provider)
+        
+        runner = CliRunner()
+        runner.invoke(main.cli, ["--dry", "show", "git", "status"])
+        result = runner.invoke(main.cli, ["--dry", "Show  git status"])
+        assert result.exit_code == 0
+        assert "git status" in result.output
+        assert provider.calls == 1
+        
+        provider.chunks = ["git status --short"]
+        runner.invoke(main.cli, ["--dry", "--no-cache", "show", "git", "status"])
+        assert provider.calls == 2
+        
+        result = runner.invoke(main.cli, ["--dry", "show", "git", "status"])
+        assert "git status --short" in result.output
+        assert provider.calls == 2
+    
+    def test_cache_is_keyed_on_environment_context(self, monkeypatch):
+        provider = FakeProvider(["aws s3 ls"])
+        monkeypatch.setattr(main, "get_provider", lambda name: provider)
+        runner = CliRunner()
+        
+        monkeypatch.setenv("AWS_PROFILE", "prod")
+        runner.invoke(main.cli, ["--dry", "list", "buckets"])
+        monkeypatch.setenv("AWS_PROFILE", "dev")
+        runner.invoke(main.cli, ["--dry", "list", "buckets"])
+        assert provider.calls == 2
+    
+    def test_copy_with_osc52_writes_escape_sequence(self, capsys):
+        assert main.copy_to_clipboard("ls -la", "osc52")
+        assert capsys.readouterr().out == "\x1b]52;c;bHMgLWxh\x07"
+    
+    @pytest.mark.parametrize(
+        "env_vars, expected",
+        [
+            ({"TERM_PROGRAM": "iTerm.app"}, True),
+            ({"TERM_PROGRAM": "Apple_Terminal"}, False),
+            ({"TERM_PROGRAM": "tmux"}, False),
+            ({"TERM_PROGRAM": "SomethingNew"}, False),
+            ({}, False),
+            ({"SSH_TTY": "/dev/pts/0"}, True),
+            ({"SSH_CONNECTION": "10.0.0.1 5000 10.0.0.2 22"}, True),
+        ],
+    )
+    def test_auto_clipboard_method(self, monkeypatch, env_vars, expected):
+        for name in ("TERM_PROGRAM", "SSH_TTY", "SSH_CONNECTION"):
+            monkeypatch.delenv(name, raising=False)
+        for name, value in env_vars.items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setattr(sys.stdout, "isatty", lambda: True)
+        assert main.supports_osc52() is expected
+    
+    def test_auto_clipboard_method_needs_a_tty(self, monkeypatch):
+        monkeypatch.setenv("TERM_PROGRAM", "iTerm.app")
+        monkeypatch.setattr(sys.stdout, "isatty", lambda: False)
+        assert not main.supports_osc52()
+    
+    def test_race_rejects_provider_option(self):
+        result = CliRunner().invoke(main.cli, ["--race", "--provider", "openai", "ls"])
+        assert result.exit_code == 2
+        assert "--provider" in result.output
+    
+    def test_race_returns_first_successful_provider(self):
+        failing = FakeProvider([], error=RuntimeError("boom"))
+        empty = FakeProvider(["```\n```"])
+        slow = FakeProvider(["ls -la"], delay=5)
+        fast = FakeProvider(["ls"], delay=0.01)
+        env = detect_environment()
+        
+        ai_providers = [failing, empty, slow, fast]
+        winner, command = asyncio.run(main.race_providers(ai_providers, "list", env))
+        assert winner is fast
+        assert command == "ls"
+    
+    def test_race_skips_empty_answers(self):
+        empty = FakeProvider([])
+        slower = FakeProvider(["ls -la"], delay=0.01)
+        env = detect_environment()
+        
+        winner, command = asyncio.run(main.race_providers([empty, slower], "list", env))
+        assert winner is slower
+        assert command == "ls -la"